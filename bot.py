@@ -1,14 +1,22 @@
 import asyncio
+import html
 import logging
 import sys
 import os
-from typing import Dict
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple, TypeVar, Union
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from redis.asyncio import Redis
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.filters import Command, CommandObject
 from aiogram.types import (
     InlineQuery, 
     InlineQueryResultCachedPhoto,
@@ -17,9 +25,9 @@ from aiogram.types import (
     BufferedInputFile,
     Message
 )
-from asyncio_throttle import Throttler
+from aiolimiter import AsyncLimiter
 
-from mermaid_renderer import renderer
+from mermaid_renderer import renderer, get_diagram_key
 
 load_dotenv()
 
@@ -33,148 +41,331 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 bot = Bot(
     token=os.getenv("BOT_TOKEN"),
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    session=AiohttpSession(
+        json_loads=orjson.loads,
+        json_dumps=lambda obj: orjson.dumps(obj).decode()
+    )
 )
 dp = Dispatcher()
 
-image_cache: Dict[str, str] = {}
-throttler = Throttler(rate_limit=2, period=1)
+def parse_chat_id(value: Optional[str]) -> Optional[Union[int, str]]:
+    """Parse a numeric chat id or an @username; None if value is empty or invalid"""
+    value = (value or "").strip()
+    if value.startswith("@") and len(value) > 1:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+REDIS_URL = os.getenv("REDIS_URL")
+# Private channel the bot posts to once per diagram to obtain a reusable file_id
+MEDIA_CHAT_ID = parse_chat_id(os.getenv("MEDIA_CHAT_ID"))
+FILE_ID_TTL = 30 * 86_400
+# How many times to wait out a flood-control reply before giving up on an upload
+MEDIA_UPLOAD_ATTEMPTS = 3
+
+# Shared file_id store across workers; the in-process cache sits in front of it
+redis_client = Redis.from_url(REDIS_URL) if REDIS_URL else None
+image_cache: TTLCache = TTLCache(maxsize=10_000, ttl=86_400)
+upload_inflight: Dict[str, asyncio.Future] = {}
+# Strong references so fire-and-forget render tasks aren't garbage collected
+background_tasks: Set[asyncio.Task] = set()
+# Each user's latest pending inline render as (diagram_key, task); a newer query
+# cancels it so prefixes typed along the way don't get rendered and uploaded
+inline_renders: Dict[int, Tuple[str, asyncio.Task]] = {}
+# Wait this long for the user to stop typing before rendering an inline query
+INLINE_RENDER_DELAY = 1.0
+MAX_BACKGROUND_RENDERS = 100
+
+# Telegram allows ~30 requests/s overall, ~1 message/s per chat and ~20 messages/min
+# in a group or channel (the media chat)
+global_limiter = AsyncLimiter(30, 1)
+CHAT_LIMITER_IDLE = 60
+# Limiters are dropped only once nobody is waiting on them and they have sat idle
+# for CHAT_LIMITER_IDLE; a fresh one then behaves the same as the old one
+chat_limiters: Dict[Union[int, str], AsyncLimiter] = {}
+chat_limiter_users: Dict[Union[int, str], int] = {}
+chat_limiter_last_used: Dict[Union[int, str], float] = {}
+_last_limiter_sweep = 0.0
+
+def _sweep_chat_limiters(now: float):
+    """Drop per-chat limiters that are unused and have been idle for CHAT_LIMITER_IDLE"""
+    global _last_limiter_sweep
+    if now - _last_limiter_sweep < CHAT_LIMITER_IDLE:
+        return
+    _last_limiter_sweep = now
+    for chat_id, last_used in list(chat_limiter_last_used.items()):
+        if not chat_limiter_users.get(chat_id) and now - last_used >= CHAT_LIMITER_IDLE:
+            chat_limiters.pop(chat_id, None)
+            chat_limiter_users.pop(chat_id, None)
+            del chat_limiter_last_used[chat_id]
+
+def get_chat_limiter(chat_id: Union[int, str]) -> AsyncLimiter:
+    """Return the per-chat rate limiter for chat_id"""
+    now = time.monotonic()
+    _sweep_chat_limiters(now)
+    limiter = chat_limiters.get(chat_id)
+    if limiter is None:
+        # 1 per 3s keeps the media chat under both the per-second and per-minute limits
+        rate = AsyncLimiter(1, 3) if chat_id == MEDIA_CHAT_ID else AsyncLimiter(1, 1)
+        limiter = chat_limiters[chat_id] = rate
+    chat_limiter_last_used[chat_id] = now
+    return limiter
+
+@asynccontextmanager
+async def chat_limit(chat_id: Union[int, str]) -> AsyncIterator[None]:
+    """Hold the per-chat limiter, keeping it from being swept while in use"""
+    limiter = get_chat_limiter(chat_id)
+    chat_limiter_users[chat_id] = chat_limiter_users.get(chat_id, 0) + 1
+    try:
+        async with limiter:
+            yield
+    finally:
+        chat_limiter_users[chat_id] -= 1
+        chat_limiter_last_used[chat_id] = time.monotonic()
+
+async def tg_call(call: Callable[[], Awaitable[T]], chat_id: Optional[Union[int, str]] = None) -> T:
+    """Make a Telegram API call under the per-chat (if given) and global limits"""
+    # Wait for the chat's turn first so queued sends to one chat don't hold global tokens
+    if chat_id is not None:
+        async with chat_limit(chat_id):
+            async with global_limiter:
+                return await call()
+    async with global_limiter:
+        return await call()
+
+async def get_cached_file_id(cache_key: str) -> Optional[str]:
+    """Look up file_id in the local cache, then in Redis"""
+    if cache_key in image_cache:
+        return image_cache[cache_key]
+    if not redis_client:
+        return None
+    try:
+        file_id = await redis_client.get(f"mmf:{cache_key}")
+    except Exception as e:
+        logger.warning(f"Failed to read file_id from Redis: {e}")
+        return None
+    if file_id is None:
+        return None
+    file_id = file_id.decode()
+    image_cache[cache_key] = file_id
+    return file_id
+
+async def cache_file_id(cache_key: str, file_id: str):
+    """Store file_id in the local cache and in Redis"""
+    image_cache[cache_key] = file_id
+    if not redis_client:
+        return
+    try:
+        await redis_client.set(f"mmf:{cache_key}", file_id, ex=FILE_ID_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to write file_id to Redis: {e}")
 
-async def upload_image_to_telegram(image_bytes: bytes, diagram_code: str, user_id: int) -> str:
+async def upload_image_to_telegram(image_bytes: bytes, cache_key: str) -> str:
     """Upload image to Telegram and return file_id"""
     try:
         # Create a unique filename
-        diagram_hash = hash(diagram_code) % 1000000
-        filename = f"mermaid_{diagram_hash}.png"
+        filename = f"mermaid_{cache_key[:12]}.jpg"
         
         # Check cache first
-        cache_key = str(diagram_hash)
-        if cache_key in image_cache:
+        cached_file_id = await get_cached_file_id(cache_key)
+        if cached_file_id:
             logger.info(f"Using cached file_id for diagram {cache_key}")
-            return image_cache[cache_key]
+            return cached_file_id
         
-        # Upload to Telegram by sending to the user who made the query
-        photo = BufferedInputFile(image_bytes, filename=filename)
+        # Piggyback on an upload of the same diagram that is already running
+        inflight = upload_inflight.get(cache_key)
+        if inflight:
+            logger.info(f"Waiting for in-flight upload of diagram {cache_key}")
+            return await asyncio.shield(inflight)
         
+        future = asyncio.get_running_loop().create_future()
+        upload_inflight[cache_key] = future
         try:
-            # Send to user's chat temporarily
-            message = await bot.send_photo(
-                chat_id=user_id,
-                photo=photo,
-                caption="🔄 Preparing image for inline mode...",
-                disable_notification=True
+            file_id = await _send_photo_for_file_id(image_bytes, filename)
+            if file_id:
+                # Cache the file_id
+                await cache_file_id(cache_key, file_id)
+                logger.info(f"Cached new file_id for diagram {cache_key}")
+            future.set_result(file_id)
+            return file_id
+        finally:
+            del upload_inflight[cache_key]
+            if not future.done():
+                future.set_result(None)
+        
+    except Exception as e:
+        logger.error(f"Error uploading image to Telegram: {e}")
+        return None
+
+async def _send_photo_for_file_id(image_bytes: bytes, filename: str) -> Optional[str]:
+    """Post the image to the media storage chat and return its file_id"""
+    photo = BufferedInputFile(image_bytes, filename=filename)
+    
+    for attempt in range(1, MEDIA_UPLOAD_ATTEMPTS + 1):
+        try:
+            message = await tg_call(
+                lambda: bot.send_photo(
+                    chat_id=MEDIA_CHAT_ID,
+                    photo=photo,
+                    disable_notification=True
+                ),
+                MEDIA_CHAT_ID
             )
-            file_id = message.photo[-1].file_id  # Get the largest photo
-            
-            # Delete the temporary message to keep user's chat clean
-            await bot.delete_message(chat_id=user_id, message_id=message.message_id)
-            
+        except TelegramRetryAfter as e:
+            if attempt == MEDIA_UPLOAD_ATTEMPTS:
+                logger.warning(f"Giving up on media chat upload after {attempt} flood control replies")
+                return None
+            logger.warning(f"Media chat flood control, retrying in {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+            continue
         except Exception as e:
-            logger.warning(f"Failed to upload image to user {user_id}: {e}")
+            logger.warning(f"Failed to upload image to media chat {MEDIA_CHAT_ID}: {e}")
             return None
         
-        # Cache the file_id
-        image_cache[cache_key] = file_id
-        logger.info(f"Cached new file_id for diagram {cache_key}")
-        
-        return file_id
-        
+        return message.photo[-1].file_id  # Get the largest photo
+    return None
+
+async def _background_render_and_cache(diagram_code: str, diagram_key: str):
+    """Render a diagram and upload it so later inline queries hit the cache"""
+    try:
+        await asyncio.sleep(INLINE_RENDER_DELAY)
+        image_bytes, error_message = await renderer.render_diagram(diagram_code)
+        if not image_bytes:
+            logger.info(f"Background render of diagram {diagram_key} failed: {error_message}")
+            return
+        await upload_image_to_telegram(image_bytes, diagram_key)
     except Exception as e:
-        logger.error(f"Error uploading image to Telegram: {e}")
-        return None
+        logger.error(f"Error in background render: {e}")
+
+def _schedule_inline_render(user_id: int, diagram_code: str, diagram_key: Optional[str]):
+    """Replace the user's pending inline render with one for diagram_key (None cancels it)"""
+    pending = inline_renders.get(user_id)
+    if pending:
+        if pending[0] == diagram_key:
+            return
+        pending[1].cancel()
+        del inline_renders[user_id]
+    if diagram_key is None:
+        return
+    if len(background_tasks) >= MAX_BACKGROUND_RENDERS:
+        logger.warning(f"Too many pending background renders, skipping diagram {diagram_key}")
+        return
+    
+    task = asyncio.create_task(_background_render_and_cache(diagram_code, diagram_key))
+    background_tasks.add(task)
+    inline_renders[user_id] = (diagram_key, task)
+    
+    def forget(done: asyncio.Task):
+        background_tasks.discard(done)
+        if inline_renders.get(user_id, (None, None))[1] is done:
+            del inline_renders[user_id]
+    
+    task.add_done_callback(forget)
 
 @dp.inline_query()
 async def handle_inline_query(inline_query: InlineQuery):
     """Handle inline queries for Mermaid diagram rendering"""
     query_text = inline_query.query.strip()
+    user_id = inline_query.from_user.id
     
-    async with throttler:
-        try:
-            if not query_text:
-                results = [
-                    InlineQueryResultArticle(
-                        id="help",
-                        title="📝 Enter Mermaid diagram code",
-                        description="Type your Mermaid diagram syntax to render it",
-                        input_message_content=InputTextMessageContent(
-                            message_text="ℹ️ <b>How to use InMermaid Bot:</b>\n\n"
-                                        "1. Type <code>@inmermaidbot</code> followed by your Mermaid code\n"
-                                        "2. Select the rendered image to send\n"
-                                        "3. Or send code directly to @inmermaidbot for higher quality\n\n"
-                                        "<b>Example:</b>\n"
-                                        "<code>@inmermaidbot graph TD\n    A[Start] --> B[Process]\n    B --> C[End]</code>"
-                        )
-                    )
-                ]
-                await inline_query.answer(results, cache_time=300)
-                return
-            
-            # Render the Mermaid diagram
-            image_bytes, error_message = await renderer.render_diagram(query_text)
-            
-            results = []
-            
-            if image_bytes:
-                diagram_id = f"mermaid_{hash(query_text) % 1000000}"
-                
-                # Upload image and get file_id
-                file_id = await upload_image_to_telegram(image_bytes, query_text, inline_query.from_user.id)
-                
-                if file_id:
-                    results.append(
-                        InlineQueryResultCachedPhoto(
-                            id=diagram_id,
-                            photo_file_id=file_id,
-                        )
-                    )
-                else:
-                    results.append(
-                        InlineQueryResultArticle(
-                            id=diagram_id,
-                            title="✅ Valid Mermaid Diagram",
-                            description=f"Share this diagram code ({len(query_text)} chars)",
-                            input_message_content=InputTextMessageContent(
-                                message_text=f"🎨 <b>Mermaid Diagram</b>\n\n"
-                                            f"<code>{query_text}</code>\n\n"
-                                            f"💡 <i>Send this code to @inmermaidbot to get the rendered image!</i>"
-                            )
-                        )
-                    )
-            
-            if error_message:
-                # Error - show error message
-                results.append(
-                    InlineQueryResultArticle(
-                        id="error",
-                        title="❌ Syntax Error",
-                        description=error_message[:100],
-                        input_message_content=InputTextMessageContent(
-                            message_text=f"❌ <b>Mermaid Syntax Error:</b>\n\n"
-                                        f"{error_message}\n\n"
-                                        f"<b>Your code:</b>\n<code>{query_text}</code>\n\n"
-                                        f"💡 <i>Check your syntax at https://mermaid.live/</i>"
-                        )
+    try:
+        if not query_text:
+            _schedule_inline_render(user_id, query_text, None)
+            results = [
+                InlineQueryResultArticle(
+                    id="help",
+                    title="📝 Enter Mermaid diagram code",
+                    description="Type your Mermaid diagram syntax to render it",
+                    input_message_content=InputTextMessageContent(
+                        message_text="ℹ️ <b>How to use InMermaid Bot:</b>\n\n"
+                                    "1. Type <code>@inmermaidbot</code> followed by your Mermaid code\n"
+                                    "2. Select the rendered image to send\n"
+                                    "3. Or send code directly to @inmermaidbot for higher quality\n\n"
+                                    "<b>Example:</b>\n"
+                                    "<code>@inmermaidbot graph TD\n    A[Start] --> B[Process]\n    B --> C[End]</code>"
                     )
                 )
-            
-            await inline_query.answer(results, cache_time=60)
-            
-        except Exception as e:
-            logger.error(f"Error in inline query handler: {e}")
-            error_results = [
+            ]
+            await tg_call(lambda: inline_query.answer(results, cache_time=300))
+            return
+        
+        diagram_key = get_diagram_key(query_text)
+        diagram_id = f"mermaid_{diagram_key}"
+        
+        # Rendered before: answer with the image right away
+        file_id = await get_cached_file_id(diagram_key)
+        if file_id:
+            _schedule_inline_render(user_id, query_text, None)
+            # Served without a render, so count it for pre-warming here
+            renderer.record_hit(query_text)
+            results = [
+                InlineQueryResultCachedPhoto(
+                    id=diagram_id,
+                    photo_file_id=file_id,
+                )
+            ]
+            await tg_call(lambda: inline_query.answer(results, cache_time=60))
+            return
+        
+        error_message = renderer.get_recent_error(query_text)
+        if error_message:
+            _schedule_inline_render(user_id, query_text, None)
+            # Error - show error message
+            results = [
                 InlineQueryResultArticle(
-                    id="system_error",
-                    title="❌ System Error",
-                    description="Internal error occurred",
+                    id="error",
+                    title="❌ Syntax Error",
+                    description=error_message[:100],
                     input_message_content=InputTextMessageContent(
-                        message_text=f"❌ <b>System Error:</b>\n\n{str(e)}\n\n"
-                                    f"Please try again or contact support."
+                        message_text=f"❌ <b>Mermaid Syntax Error:</b>\n\n"
+                                    f"{html.escape(error_message)}\n\n"
+                                    f"<b>Your code:</b>\n<code>{html.escape(query_text)}</code>\n\n"
+                                    f"💡 <i>Check your syntax at https://mermaid.live/</i>"
                     )
                 )
             ]
-            await inline_query.answer(error_results, cache_time=10)
+            await tg_call(lambda: inline_query.answer(results, cache_time=10))
+            return
+        
+        # Rendering takes longer than the inline query timeout allows, so answer
+        # with a code preview now and have the image ready for the next query
+        _schedule_inline_render(user_id, query_text, diagram_key)
+        
+        results = [
+            InlineQueryResultArticle(
+                id=diagram_id,
+                title="⏳ Rendering diagram...",
+                description=f"Share this diagram code ({len(query_text)} chars) or wait a moment for the image",
+                input_message_content=InputTextMessageContent(
+                    message_text=f"🎨 <b>Mermaid Diagram</b>\n\n"
+                                f"<code>{html.escape(query_text)}</code>\n\n"
+                                f"💡 <i>Send this code to @inmermaidbot to get the rendered image!</i>"
+                )
+            )
+        ]
+        await tg_call(lambda: inline_query.answer(results, cache_time=5))
+        
+    except Exception as e:
+        logger.error(f"Error in inline query handler: {e}")
+        error_results = [
+            InlineQueryResultArticle(
+                id="system_error",
+                title="❌ System Error",
+                description="Internal error occurred",
+                input_message_content=InputTextMessageContent(
+                    message_text=f"❌ <b>System Error:</b>\n\n{html.escape(str(e))}\n\n"
+                                f"Please try again or contact support."
+                )
+            )
+        ]
+        await tg_call(lambda: inline_query.answer(error_results, cache_time=10))
 
 @dp.message(Command("start"))
 async def start_command(message: Message):
@@ -184,6 +375,8 @@ async def start_command(message: Message):
         "Send me Mermaid diagram code and I'll render it as an image\n\n"
         "<b>Inline Mode:</b>\n"
         "Use <code>@inmermaidbot your_code</code> in any chat to render and share diagrams\n\n"
+        "<b>SVG:</b>\n"
+        "Send <code>/svg your_code</code> to get the diagram as a scalable SVG file\n\n"
         "<b>Example diagram code:</b>\n"
         "<code>graph TD\n"
         "    A[Start] --> B{Decision}\n"
@@ -194,7 +387,51 @@ async def start_command(message: Message):
         "Learn more: https://mermaid.js.org/\n"
         "Test syntax: https://mermaid.live/"
     )
-    await message.answer(welcome_text)
+    await tg_call(lambda: message.answer(welcome_text), message.chat.id)
+
+
+@dp.message(Command("svg"))
+async def svg_command(message: Message, command: CommandObject):
+    """Handle /svg command: send the diagram as an SVG document"""
+    mermaid_code = (command.args or "").strip()
+    
+    if not mermaid_code:
+        await tg_call(
+            lambda: message.answer("Send <code>/svg</code> followed by your Mermaid diagram code"),
+            message.chat.id
+        )
+        return
+    
+    # Chat actions are not messages, so only the global limit applies
+    await tg_call(lambda: bot.send_chat_action(message.chat.id, "upload_document"))
+    
+    try:
+        logger.info(f"Rendering SVG diagram for user {message.from_user.id}")
+        svg_bytes, error_message = await renderer.render_diagram_svg(mermaid_code)
+        
+        if svg_bytes:
+            document = BufferedInputFile(svg_bytes, filename="diagram.svg")
+            await tg_call(lambda: message.answer_document(document), message.chat.id)
+            logger.info(f"Successfully sent SVG diagram to user {message.from_user.id}")
+        else:
+            await tg_call(
+                lambda: message.answer(
+                    f"❌ <b>Error rendering diagram:</b>\n\n{html.escape(error_message)}\n\n"
+                    f"<b>Your code:</b>\n<code>{html.escape(mermaid_code)}</code>\n\n"
+                    f"💡 <i>Check your syntax at https://mermaid.live/</i>"
+                ),
+                message.chat.id
+            )
+    
+    except Exception as e:
+        logger.error(f"Error handling SVG command: {e}")
+        await tg_call(
+            lambda: message.answer(
+                f"❌ <b>System error:</b> {html.escape(str(e))}\n\n"
+                f"Please try again or contact support."
+            ),
+            message.chat.id
+        )
 
 
 @dp.message(F.text)
@@ -205,29 +442,36 @@ async def handle_mermaid_code(message: Message):
     if not mermaid_code or mermaid_code.startswith('/'):
         return
     
-    await bot.send_chat_action(message.chat.id, "upload_photo")
+    # Chat actions are not messages, so only the global limit applies
+    await tg_call(lambda: bot.send_chat_action(message.chat.id, "upload_photo"))
     
     try:
         logger.info(f"Rendering diagram for user {message.from_user.id}")
         image_bytes, error_message = await renderer.render_diagram(mermaid_code)
         
         if image_bytes:
-            photo = BufferedInputFile(image_bytes, filename="mermaid_diagram.png")
-            await message.answer_photo(photo)
+            photo = BufferedInputFile(image_bytes, filename="mermaid_diagram.jpg")
+            await tg_call(lambda: message.answer_photo(photo), message.chat.id)
             logger.info(f"Successfully sent diagram to user {message.from_user.id}")
         else:
             # Send error message
-            await message.answer(
-                f"❌ <b>Error rendering diagram:</b>\n\n{error_message}\n\n"
-                f"<b>Your code:</b>\n<code>{mermaid_code}</code>\n\n"
-                f"💡 <i>Check your syntax at https://mermaid.live/</i>"
+            await tg_call(
+                lambda: message.answer(
+                    f"❌ <b>Error rendering diagram:</b>\n\n{html.escape(error_message)}\n\n"
+                    f"<b>Your code:</b>\n<code>{html.escape(mermaid_code)}</code>\n\n"
+                    f"💡 <i>Check your syntax at https://mermaid.live/</i>"
+                ),
+                message.chat.id
             )
     
     except Exception as e:
         logger.error(f"Error handling message: {e}")
-        await message.answer(
-            f"❌ <b>System error:</b> {str(e)}\n\n"
-            f"Please try again or contact support."
+        await tg_call(
+            lambda: message.answer(
+                f"❌ <b>System error:</b> {html.escape(str(e))}\n\n"
+                f"Please try again or contact support."
+            ),
+            message.chat.id
         )
 
 async def main():
@@ -235,7 +479,7 @@ async def main():
     try:
         # Initialize renderer
         logger.info("Starting Mermaid renderer...")
-        await renderer.start()
+        await renderer.start(redis=redis_client)
         
         # Start polling
         logger.info("Starting bot polling...")
@@ -248,6 +492,8 @@ async def main():
     finally:
         logger.info("Shutting down...")
         await renderer.stop()
+        if redis_client:
+            await redis_client.aclose()
         await bot.session.close()
 
 if __name__ == "__main__":
@@ -255,6 +501,18 @@ if __name__ == "__main__":
     if not bot_token:
         logger.error("BOT_TOKEN not found in environment variables!")
         sys.exit(1)
+    if not os.getenv("MEDIA_CHAT_ID"):
+        logger.error("MEDIA_CHAT_ID not found in environment variables!")
+        sys.exit(1)
+    if not MEDIA_CHAT_ID:
+        logger.error(f"Invalid MEDIA_CHAT_ID {os.getenv('MEDIA_CHAT_ID')!r}: expected a numeric chat id or @username")
+        sys.exit(1)
+    
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        logger.info("uvloop not available, using the default event loop")
     
     try:
         asyncio.run(main())
@@ -2,126 +2,493 @@ import asyncio
 import base64
 import hashlib
 import logging
-from io import BytesIO
-from typing import Optional, Tuple
+import math
+import os
+import pathlib
+import tempfile
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import oxipng
+from cachetools import LRUCache, TTLCache
 from playwright.async_api import async_playwright, Browser, Page
-from PIL import Image
+from redis.asyncio import Redis
 
 logger = logging.getLogger(__name__)
 
+RENDER_CACHE_TTL = 30 * 86_400
+# Sorted set of diagram keys by request count, used to pre-warm the cache on startup
+HITS_KEY = "diagram:hits"
+PREWARM_COUNT = 50
+# Only the most requested diagrams are kept in HITS_KEY
+HITS_MAX = 10_000
+PAGE_POOL_SIZE = 4
+RENDER_BATCH_SIZE = 8
+RENDER_BATCH_WINDOW = 0.005
+# Per evaluate call; a batch that overruns it is retried one diagram at a time, so a
+# hanging diagram costs the others in its batch at most one extra RENDER_TIMEOUT
+RENDER_TIMEOUT = 10
+# How long a render waits for a free page before reporting the renderer as unavailable
+PAGE_WAIT_TIMEOUT = 15
+# Worst case for a queued render: a full batch that fails, then a retry on its own
+RENDER_WAIT_TIMEOUT = 2 * (PAGE_WAIT_TIMEOUT + RENDER_TIMEOUT)
+PAGE_RETRY_DELAY = 1
+PAGE_RETRY_MAX_DELAY = 30
+# Layout viewport; screenshots shrink it to the diagram, so it is restored before each layout
+VIEWPORT_SIZE = {"width": 1200, "height": 800}
+DIAGRAM_PADDING = 20
+PNG_COLOR_TYPE_OFFSET = 25
+PNG_COLOR_TYPE_RGBA = 6
+MERMAID_JS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "mermaid.min.js")
+
+class RendererUnavailableError(Exception):
+    """Raised when no browser page becomes available in time"""
+
+class RenderTimeoutError(Exception):
+    """Raised when mermaid takes longer than RENDER_TIMEOUT on a diagram"""
+
+def get_diagram_key(mermaid_code: str) -> str:
+    """Stable content-addressed key for a diagram, shared by all caches"""
+    return hashlib.blake2b(mermaid_code.encode(), digest_size=16).hexdigest()
+
 class MermaidRenderer:
     def __init__(self):
         self.browser: Optional[Browser] = None
-        self.cache = {}
+        self.cache: LRUCache = LRUCache(maxsize=1024)
+        # Failures are only remembered briefly so transient errors can be retried
+        self.neg_cache: TTLCache = TTLCache(maxsize=256, ttl=10)
+        self.redis: Optional[Redis] = None
+        self._page_pool: "asyncio.Queue[Page]" = asyncio.Queue()
+        self._shell_path: Optional[str] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._render_queue: "asyncio.Queue[Tuple[str, asyncio.Future]]" = asyncio.Queue()
+        self._batch_task: Optional[asyncio.Task] = None
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._browser_lock = asyncio.Lock()
         
-    async def start(self):
+    async def start(self, redis: Optional[Redis] = None):
         """Initialize the browser"""
+        self.redis = redis
         try:
+            self._shell_path = self._write_shell()
             self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=True,
-                args=['--no-sandbox', '--disable-setuid-sandbox']
-            )
+            self.browser = await self._launch_browser()
+            for _ in range(PAGE_POOL_SIZE):
+                self._page_pool.put_nowait(await self._new_page())
+            self._batch_task = asyncio.create_task(self._batch_worker())
             logger.info("Mermaid renderer started successfully")
         except Exception as e:
             logger.error(f"Failed to start Mermaid renderer: {e}")
             raise
+        
+        await self._prewarm()
     
     async def stop(self):
         """Close the browser"""
+        if self._batch_task:
+            self._batch_task.cancel()
         if self.browser:
             await self.browser.close()
         if hasattr(self, 'playwright'):
             await self.playwright.stop()
+        if self._shell_path:
+            os.remove(self._shell_path)
         logger.info("Mermaid renderer stopped")
     
+    def _write_shell(self) -> str:
+        """Write the HTML shell to a temp file that pool pages navigate to once"""
+        if not os.path.exists(MERMAID_JS_PATH):
+            raise RuntimeError(f"{MERMAID_JS_PATH} not found; see README for bundling mermaid.js")
+        mermaid_src = pathlib.Path(MERMAID_JS_PATH).as_uri()
+        
+        fd, path = tempfile.mkstemp(prefix="mermaid_shell_", suffix=".html")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self._create_html_content(mermaid_src))
+        return path
+    
+    async def _launch_browser(self) -> Browser:
+        """Launch headless Chromium"""
+        return await self.playwright.chromium.launch(
+            headless=True,
+            args=['--no-sandbox', '--disable-setuid-sandbox']
+        )
+    
+    async def _ensure_browser(self):
+        """Relaunch the browser if it has crashed or disconnected"""
+        async with self._browser_lock:
+            if self.browser.is_connected():
+                return
+            logger.warning("Browser disconnected, relaunching")
+            self.browser = await self._launch_browser()
+            
+            # Pages still pooled belong to the dead browser; swap them for fresh ones
+            stale = 0
+            for _ in range(self._page_pool.qsize()):
+                page = self._page_pool.get_nowait()
+                if self._page_is_dead(page):
+                    stale += 1
+                else:
+                    self._page_pool.put_nowait(page)
+            for _ in range(stale):
+                task = asyncio.create_task(self._refill_page())
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+    
+    def _page_is_dead(self, page: Page) -> bool:
+        """Whether the page or the browser it belongs to has gone away"""
+        browser = page.context.browser
+        return page.is_closed() or browser is None or not browser.is_connected()
+    
+    async def _new_page(self) -> Page:
+        """Open a page with mermaid.js loaded and initialized"""
+        page = await self.browser.new_page()
+        try:
+            await page.set_viewport_size(VIEWPORT_SIZE)
+            # goto waits for the load event, by which point the inline init script has run
+            await page.goto(pathlib.Path(self._shell_path).as_uri(), timeout=15000)
+            init_error = await page.evaluate("window.rendererReady === true ? null : String(window.mermaidError)")
+            if init_error:
+                raise RuntimeError(f"Failed to initialize Mermaid: {init_error}")
+        except Exception:
+            await page.close()
+            raise
+        return page
+    
+    async def _release_page(self, page: Page, page_ok: bool):
+        """Return a page to the pool, replacing it if it may be in a bad state"""
+        if page_ok:
+            self._page_pool.put_nowait(page)
+            return
+        try:
+            await page.close()
+        except Exception as e:
+            logger.warning(f"Failed to close broken page: {e}")
+        task = asyncio.create_task(self._refill_page())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _refill_page(self):
+        """Add a fresh page to the pool, retrying with backoff until it succeeds"""
+        delay = PAGE_RETRY_DELAY
+        while True:
+            try:
+                await self._ensure_browser()
+                self._page_pool.put_nowait(await self._new_page())
+                return
+            except Exception as e:
+                logger.error(f"Failed to replace broken page, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PAGE_RETRY_MAX_DELAY)
+    
+    async def _acquire_page(self) -> Page:
+        """Take a page from the pool, giving up after PAGE_WAIT_TIMEOUT"""
+        try:
+            return await asyncio.wait_for(self._page_pool.get(), PAGE_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RendererUnavailableError("No browser page available") from None
+    
+    async def _record_hit(self, diagram_key: str, mermaid_code: str):
+        """Count a request for the diagram and remember its code for pre-warming"""
+        try:
+            # Atomic so the members read back are exactly the ones trimmed
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zincrby(HITS_KEY, 1, diagram_key)
+                pipe.zrange(HITS_KEY, 0, -(HITS_MAX + 1))
+                pipe.zremrangebyrank(HITS_KEY, 0, -(HITS_MAX + 1))
+                _, trimmed, _ = await pipe.execute()
+            trimmed = {key.decode() for key in trimmed}
+            # Keep code only for diagrams still counted, so mmc: stays bounded by HITS_MAX
+            async with self.redis.pipeline(transaction=False) as pipe:
+                if trimmed:
+                    pipe.delete(*(f"mmc:{key}" for key in trimmed))
+                if diagram_key not in trimmed:
+                    pipe.set(f"mmc:{diagram_key}", mermaid_code, ex=RENDER_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record diagram hit in Redis: {e}")
+    
+    async def _prewarm(self):
+        """Render the most requested diagrams so the first queries hit the cache"""
+        if not self.redis:
+            return
+        try:
+            diagram_keys = [key.decode() for key in await self.redis.zrevrange(HITS_KEY, 0, PREWARM_COUNT - 1)]
+            if not diagram_keys:
+                return
+            codes = await self.redis.mget([f"mmc:{key}" for key in diagram_keys])
+        except Exception as e:
+            logger.warning(f"Failed to load popular diagrams from Redis: {e}")
+            return
+        
+        # Diagrams whose code has expired can no longer be rendered
+        popular = [(key, code.decode()) for key, code in zip(diagram_keys, codes) if code]
+        await asyncio.gather(*(self._render_image(code, key, "jpeg") for key, code in popular))
+        logger.info(f"Pre-warmed cache with {len(popular)} popular diagrams")
+    
     def _get_cache_key(self, mermaid_code: str) -> str:
         """Generate cache key for mermaid code"""
-        return hashlib.md5(mermaid_code.encode()).hexdigest()
+        return get_diagram_key(mermaid_code)
+    
+    async def _get_cached_image(self, cache_key: str) -> Optional[bytes]:
+        """Fetch rendered image bytes from the shared Redis cache"""
+        if not self.redis:
+            return None
+        try:
+            return await self.redis.get(f"mmr:{cache_key}")
+        except Exception as e:
+            logger.warning(f"Failed to read render cache from Redis: {e}")
+            return None
     
-    async def render_diagram(self, mermaid_code: str) -> Tuple[Optional[bytes], Optional[str]]:
+    async def _store_cached_image(self, cache_key: str, image_bytes: bytes):
+        """Store rendered image bytes in the shared Redis cache"""
+        if not self.redis:
+            return
+        try:
+            await self.redis.set(f"mmr:{cache_key}", image_bytes, ex=RENDER_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to write render cache to Redis: {e}")
+    
+    async def render_diagram(self, mermaid_code: str, fmt: str = "jpeg") -> Tuple[Optional[bytes], Optional[str]]:
         """
-        Render Mermaid diagram to PNG image
+        Render Mermaid diagram to a JPEG (default) or PNG image
         Returns: (image_bytes, error_message)
         """
+        diagram_key = self.record_hit(mermaid_code)
+        return await self._render_image(mermaid_code, diagram_key, fmt)
+    
+    def record_hit(self, mermaid_code: str) -> str:
+        """Count a request for the diagram in the background and return its key"""
+        diagram_key = self._get_cache_key(mermaid_code)
+        if self.redis:
+            task = asyncio.create_task(self._record_hit(diagram_key, mermaid_code))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        return diagram_key
+    
+    async def _render_image(self, mermaid_code: str, diagram_key: str, fmt: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """Render to a JPEG or PNG image without counting the request"""
+        cache_key = f"{fmt}:{diagram_key}"
+        return await self._render(mermaid_code, cache_key, lambda svg: self._capture_screenshot(svg, fmt))
+    
+    async def render_diagram_svg(self, mermaid_code: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Render Mermaid diagram to SVG markup, skipping rasterization
+        Returns: (svg_bytes, error_message)
+        """
+        cache_key = f"svg:{self._get_cache_key(mermaid_code)}"
+        return await self._render(mermaid_code, cache_key, self._capture_svg)
+    
+    def get_recent_error(self, mermaid_code: str, fmt: str = "jpeg") -> Optional[str]:
+        """Return the error message of a recent failed render, if any"""
+        result = self.neg_cache.get(f"{fmt}:{self._get_cache_key(mermaid_code)}")
+        return result[1] if result else None
+    
+    async def _render(
+        self,
+        mermaid_code: str,
+        cache_key: str,
+        capture: Callable[[str], Awaitable[Tuple[Optional[bytes], Optional[str]]]]
+    ) -> Tuple[Optional[bytes], Optional[str]]:
+        """Return a cached result or render once, sharing it with concurrent callers"""
         if not self.browser:
             return None, "Renderer not initialized"
         
-        cache_key = self._get_cache_key(mermaid_code)
         if cache_key in self.cache:
             logger.info("Returning cached result")
             return self.cache[cache_key]
+        if cache_key in self.neg_cache:
+            logger.info("Returning recent error result")
+            return self.neg_cache[cache_key]
+        
+        # Coalesce concurrent renders of the same diagram into one
+        inflight = self._inflight.get(cache_key)
+        if inflight:
+            logger.info("Waiting for in-flight render")
+            return await asyncio.shield(inflight)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            result = await self._render_uncached(mermaid_code, cache_key, capture)
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[cache_key]
+            if not future.done():
+                future.set_result((None, "Rendering was interrupted"))
+    
+    async def _render_uncached(
+        self,
+        mermaid_code: str,
+        cache_key: str,
+        capture: Callable[[str], Awaitable[Tuple[Optional[bytes], Optional[str]]]]
+    ) -> Tuple[Optional[bytes], Optional[str]]:
+        """Fetch from the shared cache or render and convert the SVG with capture()"""
+        cached_bytes = await self._get_cached_image(cache_key)
+        if cached_bytes:
+            logger.info("Returning result from shared cache")
+            result = (cached_bytes, None)
+            self.cache[cache_key] = result
+            return result
         
-        page = None
         try:
-            page = await self.browser.new_page()
-            
-            await page.set_viewport_size({"width": 1200, "height": 800})
-            
-            html_content = self._create_html_content(mermaid_code)
-            
-            await page.set_content(html_content)
-            
             try:
-                # Wait for either success or error
-                await page.wait_for_function(
-                    "window.mermaidReady === true || window.mermaidError !== undefined",
-                    timeout=10000
-                )
-                
-                # Check if there was an error
-                error_message = await page.evaluate("window.mermaidError")
+                svg, error_message = await self._render_svg(mermaid_code)
                 if error_message:
                     result = (None, f"Mermaid error: {error_message}")
-                    self.cache[cache_key] = result
+                    self.neg_cache[cache_key] = result
                     return result
                 
-            except Exception as e:
+            except RendererUnavailableError as e:
+                # Not the diagram's fault, so don't remember it as a failure
+                logger.error(f"Renderer unavailable: {e}")
+                return None, "Renderer unavailable"
+            except RenderTimeoutError as e:
                 logger.error(f"Timeout waiting for Mermaid: {e}")
                 result = (None, "Failed to render diagram: timeout")
-                self.cache[cache_key] = result
-                return result
-            
-            svg_element = await page.query_selector('#mermaid-container svg')
-            if not svg_element:
-                result = (None, "Failed to find rendered diagram")
-                self.cache[cache_key] = result
+                self.neg_cache[cache_key] = result
                 return result
             
-            bbox = await svg_element.bounding_box()
-            if not bbox:
-                result = (None, "Failed to get diagram dimensions")
-                self.cache[cache_key] = result
+            try:
+                result = await capture(svg)
+            except RendererUnavailableError as e:
+                logger.error(f"Renderer unavailable: {e}")
+                return None, "Renderer unavailable"
+            if not result[0]:
+                self.neg_cache[cache_key] = result
                 return result
             
-            padding = 20
-            screenshot_bytes = await page.screenshot(
-                clip={
-                    "x": max(0, bbox["x"] - padding),
-                    "y": max(0, bbox["y"] - padding),
-                    "width": bbox["width"] + 2 * padding,
-                    "height": bbox["height"] + 2 * padding
-                },
-                type="png"
-            )
-            
-            optimized_bytes = await self._optimize_image(screenshot_bytes)
-            
-            result = (optimized_bytes, None)
             self.cache[cache_key] = result
+            await self._store_cached_image(cache_key, result[0])
             return result
             
         except Exception as e:
             logger.error(f"Error rendering Mermaid diagram: {e}")
             result = (None, f"Rendering error: {str(e)}")
-            self.cache[cache_key] = result
+            self.neg_cache[cache_key] = result
             return result
+    
+    async def _render_svg(self, mermaid_code: str) -> Tuple[Optional[str], Optional[str]]:
+        """Queue code for the batch worker; returns (svg, mermaid_error_message)"""
+        future = asyncio.get_running_loop().create_future()
+        self._render_queue.put_nowait((mermaid_code, future))
+        try:
+            return await asyncio.wait_for(future, RENDER_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Batch timeouts arrive as RenderTimeoutError, so this means no page was free
+            raise RendererUnavailableError("Render was never picked up") from None
+    
+    async def _batch_worker(self):
+        """Group queued diagrams into micro-batches rendered by one page each"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._render_queue.get()]
+            # While every page is busy the queue keeps filling, so batches grow under load
+            page = await self._page_pool.get()
+            deadline = loop.time() + RENDER_BATCH_WINDOW
+            while len(batch) < RENDER_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._render_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run_batch(page, batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _run_batch(self, page: Page, batch: List[Tuple[str, asyncio.Future]]):
+        """Render a batch of diagrams in a single evaluate call"""
+        # Skip callers that already gave up waiting
+        batch = [(code, future) for code, future in batch if not future.done()]
+        if not batch:
+            self._page_pool.put_nowait(page)
+            return
+        page_ok = True
+        try:
+            results = await asyncio.wait_for(
+                page.evaluate("(codes) => renderDiagrams(codes)", [code for code, _ in batch]),
+                timeout=RENDER_TIMEOUT
+            )
+            for (_, future), item in zip(batch, results):
+                if not future.done():
+                    future.set_result((item["svg"], item["error"]))
+        except Exception as e:
+            page_ok = False
+            if isinstance(e, asyncio.TimeoutError):
+                e = RenderTimeoutError(f"Rendering took longer than {RENDER_TIMEOUT}s")
+            elif self._page_is_dead(page):
+                # A closed page or crashed browser says nothing about the diagram
+                e = RendererUnavailableError(f"Browser page closed: {e}")
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                # One bad diagram shouldn't fail the rest; retry each on its own
+                logger.warning(f"Batch of {len(batch)} diagrams failed, retrying individually: {e}")
+                for code, future in batch:
+                    task = asyncio.create_task(self._run_solo(code, future))
+                    self._batch_tasks.add(task)
+                    task.add_done_callback(self._batch_tasks.discard)
+        finally:
+            await self._release_page(page, page_ok)
+    
+    async def _run_solo(self, mermaid_code: str, future: asyncio.Future):
+        """Render a single diagram from a failed batch on its own page"""
+        try:
+            page = await self._acquire_page()
+        except RendererUnavailableError as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        await self._run_batch(page, [(mermaid_code, future)])
+    
+    async def _capture_screenshot(self, svg: str, fmt: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """Screenshot the rendered diagram as JPEG or PNG"""
+        page = await self._acquire_page()
+        page_ok = True
+        try:
+            await page.set_viewport_size(VIEWPORT_SIZE)
+            await page.evaluate("(svg) => showDiagram(svg)", svg)
+            
+            svg_element = await page.query_selector('#mermaid-container svg')
+            if not svg_element:
+                return None, "Failed to find rendered diagram"
+            
+            bbox = await svg_element.bounding_box()
+            if not bbox:
+                return None, "Failed to get diagram dimensions"
+            
+            # Crop the viewport to the diagram so Chromium only rasterizes what we keep;
+            # the body padding puts the diagram at (padding, padding)
+            padding = DIAGRAM_PADDING
+            await page.set_viewport_size({
+                "width": math.ceil(bbox["width"]) + 2 * padding,
+                "height": math.ceil(bbox["height"]) + 2 * padding
+            })
+            screenshot_bytes = await page.screenshot(
+                type=fmt,
+                quality=85 if fmt == "jpeg" else None
+            )
+        except Exception as e:
+            page_ok = False
+            if self._page_is_dead(page):
+                raise RendererUnavailableError(f"Browser page closed: {e}") from e
+            raise
         finally:
-            if page:
-                await page.close()
+            await self._release_page(page, page_ok)
+        
+        if fmt == "png":
+            screenshot_bytes = await self._optimize_image(screenshot_bytes)
+        return screenshot_bytes, None
     
-    def _create_html_content(self, mermaid_code: str) -> str:
-        """Create HTML content with Mermaid diagram"""
+    async def _capture_svg(self, svg: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """Return the rendered SVG markup as-is"""
+        return svg.encode(), None
+    
+    def _create_html_content(self, mermaid_src: str) -> str:
+        """Create HTML shell that renders diagrams on demand via renderDiagrams()"""
         return f"""
         <!DOCTYPE html>
         <html>
@@ -131,78 +498,29 @@ class MermaidRenderer:
             <style>
                 body {{
                     margin: 0;
-                    padding: 20px;
+                    padding: {DIAGRAM_PADDING}px;
                     font-family: Arial, sans-serif;
                     background: white;
-                    min-height: 100vh;
                 }}
+                /* Fixed width so width="100%" diagrams lay out the same on every page;
+                   they shrink to their own max-width and sit at the padding offset */
                 #mermaid-container {{
-                    display: flex;
-                    justify-content: center;
-                    align-items: center;
-                    min-height: 400px;
+                    width: {VIEWPORT_SIZE['width'] - 2 * DIAGRAM_PADDING}px;
                 }}
                 .mermaid {{
                     background: white;
                 }}
-                .error {{
-                    color: red;
-                    font-weight: bold;
-                    padding: 20px;
-                    border: 2px solid red;
-                    border-radius: 5px;
-                    background: #ffe6e6;
-                    max-width: 600px;
-                }}
-                #status {{
-                    position: fixed;
-                    top: 10px;
-                    right: 10px;
-                    padding: 5px 10px;
-                    background: #f0f0f0;
-                    border-radius: 3px;
-                    font-size: 12px;
-                }}
             </style>
         </head>
         <body>
-            <div id="status">Loading...</div>
             <div id="mermaid-container">
-                <div class="mermaid" id="diagram">
-{mermaid_code}
-                </div>
+                <div class="mermaid" id="diagram"></div>
             </div>
             
-            <script src="https://cdn.jsdelivr.net/npm/mermaid@10.6.1/dist/mermaid.min.js"></script>
+            <script src="{mermaid_src}"></script>
             <script>
-                console.log('Starting Mermaid initialization...');
-                document.getElementById('status').textContent = 'Initializing...';
-                
-                // Wait for mermaid to be available
-                function waitForMermaid() {{
-                    return new Promise((resolve, reject) => {{
-                        let attempts = 0;
-                        const maxAttempts = 50;
-                        
-                        function check() {{
-                            attempts++;
-                            if (typeof mermaid !== 'undefined') {{
-                                resolve();
-                            }} else if (attempts >= maxAttempts) {{
-                                reject(new Error('Mermaid failed to load'));
-                            }} else {{
-                                setTimeout(check, 100);
-                            }}
-                        }}
-                        check();
-                    }});
-                }}
-                
-                async function initAndRender() {{
+                function initMermaid() {{
                     try {{
-                        console.log('Waiting for Mermaid to load...');
-                        await waitForMermaid();
-                        
                         console.log('Initializing Mermaid...');
                         mermaid.initialize({{
                             startOnLoad: false,
@@ -220,58 +538,59 @@ class MermaidRenderer:
                             }}
                         }});
                         
-                        console.log('Rendering diagram...');
-                        document.getElementById('status').textContent = 'Rendering...';
-                        
-                        const element = document.getElementById('diagram');
-                        const diagramCode = `{mermaid_code}`;
-                        
-                        console.log('Diagram code:', diagramCode);
-                        
-                        const {{svg}} = await mermaid.render('generatedDiagram', diagramCode);
-                        
-                        element.innerHTML = svg;
-                        document.getElementById('status').textContent = 'Ready';
-                        console.log('Diagram rendered successfully');
-                        
-                        // Signal that rendering is complete
-                        window.mermaidReady = true;
+                        window.rendererReady = true;
                         
                     }} catch (error) {{
-                        console.error('Mermaid render error:', error);
-                        document.getElementById('status').textContent = 'Error';
-                        document.getElementById('mermaid-container').innerHTML = 
-                            '<div class="error">Syntax Error: ' + error.message + '</div>';
+                        console.error('Mermaid init error:', error);
                         window.mermaidError = error.message;
                     }}
                 }}
                 
-                // Start when page is loaded
-                if (document.readyState === 'loading') {{
-                    document.addEventListener('DOMContentLoaded', initAndRender);
-                }} else {{
-                    initAndRender();
+                // Render several diagrams in one call; resolves with [{{svg, error}}] in order
+                async function renderDiagrams(codes) {{
+                    const results = [];
+                    
+                    for (let i = 0; i < codes.length; i++) {{
+                        const id = 'generatedDiagram' + i;
+                        try {{
+                            const {{svg}} = await mermaid.render(id, codes[i]);
+                            results.push({{svg: svg, error: null}});
+                        }} catch (error) {{
+                            console.error('Mermaid render error:', error);
+                            // mermaid leaves its temporary container behind on failure
+                            const leftover = document.getElementById('d' + id);
+                            if (leftover) {{
+                                leftover.remove();
+                            }}
+                            results.push({{svg: null, error: error.message || String(error)}});
+                        }}
+                    }}
+                    
+                    return results;
                 }}
+                
+                // Put a rendered SVG on the page so it can be screenshotted
+                function showDiagram(svg) {{
+                    document.getElementById('diagram').innerHTML = svg;
+                }}
+                
+                // The mermaid script above is parser-blocking, so it is already defined here
+                initMermaid();
             </script>
         </body>
         </html>
         """
     
     async def _optimize_image(self, image_bytes: bytes) -> bytes:
+        # PNG recompression is CPU-bound; keep it off the event loop
+        return await asyncio.to_thread(self._optimize_image_sync, image_bytes)
+    
+    def _optimize_image_sync(self, image_bytes: bytes) -> bytes:
+        # Byte 25 is the IHDR color type; only RGBA output is worth recompressing
+        if len(image_bytes) <= PNG_COLOR_TYPE_OFFSET or image_bytes[PNG_COLOR_TYPE_OFFSET] != PNG_COLOR_TYPE_RGBA:
+            return image_bytes
         try:
-            image = Image.open(BytesIO(image_bytes))
-            
-            if image.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'RGBA':
-                    background.paste(image, mask=image.split()[-1])
-                else:
-                    background.paste(image, mask=image.split()[-1])
-                image = background
-            
-            output = BytesIO()
-            image.save(output, format='PNG', optimize=True, quality=85)
-            return output.getvalue()
+            return oxipng.optimize_from_memory(image_bytes, level=2, strip=oxipng.StripChunks.safe())
         except Exception as e:
             logger.warning(f"Failed to optimize image: {e}")
             return image_bytes